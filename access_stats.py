@@ -0,0 +1,197 @@
+# import statements
+import os
+import json
+import sqlite3
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+
+### Statistical comparison of open access and subscription articles ###
+# compares the median citation counts of the two access levels, with a bootstrap confidence interval
+# for the difference and a permutation test p-value, overall or within each subject, year or subject and year
+# citation counts are small integers, so each resample is drawn as a histogram over the distinct values
+# (cost per resample grows with the number of distinct values, not the number of articles)
+# the resampling is split into fixed-size tasks that run on a process pool, and results are cached
+# in a json file against the version of the data in the database
+
+STATS_CACHE_FNAME = 'stats_cache.json'
+N_RESAMPLES = 10000
+TASK_SIZE = 2500                # resamples per process pool task (fixed, so results do not depend on the number of workers)
+BLOCK_ELEMENTS = 2000000        # largest resample histogram matrix built at once, to keep memory use bounded
+METRIC_COLUMNS = {'citations': 'CitationCount', 'influential': 'InfluentialCitations'}
+GROUP_COLUMNS = {None: "'All'", 'subject': 'S.Subject', 'year': 'A.PubDate', 'subject_year': "S.Subject || ' ' || A.PubDate"}
+
+### Caching Setup ###
+try:
+	cache_file = open(STATS_CACHE_FNAME, 'r')
+	cache_contents = cache_file.read()
+	STATS_CACHE = json.loads(cache_contents)
+	cache_file.close()
+except:
+	STATS_CACHE = {}
+
+
+class AccessComparison():
+	def __init__(self, group, open_count, subscription_count, open_median, subscription_median, difference, ci_low, ci_high, p_value):
+		self.group = group
+		self.open_count = open_count
+		self.subscription_count = subscription_count
+		self.open_median = open_median
+		self.subscription_median = subscription_median
+		self.difference = difference
+		self.ci_low = ci_low
+		self.ci_high = ci_high
+		self.p_value = p_value
+
+	def __str__(self):
+		return "{}: median {:.1f} (open access, n={}) vs {:.1f} (subscription, n={}), difference {:.1f} [{:.1f}, {:.1f}], p = {:.4f}".format(self.group,
+				self.open_median, self.open_count, self.subscription_median, self.subscription_count, self.difference,
+				self.ci_low, self.ci_high, self.p_value)
+
+
+# function to read the version of the data in the database (set by populate_db)
+# databases built before the DataVersion table existed fall back to the file's size and modification time
+# input: database name
+# return: version string
+def get_data_version(dbname):
+	conn = sqlite3.connect(dbname)
+	try:
+		version = conn.execute("SELECT MAX(Version) FROM DataVersion").fetchone()[0]
+	except sqlite3.OperationalError:
+		version = None
+	conn.close()
+	if version is None:
+		info = os.stat(dbname)
+		return "file-{}-{}".format(info.st_size, info.st_mtime_ns)
+	return str(version)
+
+
+# function to query the database for the metric values of each access level
+# input: database name, metric ('citations' or 'influential'), grouping (None, 'subject', 'year' or 'subject_year')
+# return: dictionary (group:(numpy array of open access values, numpy array of subscription values))
+def load_access_samples(dbname, metric='citations', by=None):
+	conn = sqlite3.connect(dbname)
+	cur = conn.cursor()
+
+	statement = """SELECT {0}, C.AccessLevel, A.{1}
+					FROM Articles as A
+						JOIN Subjects as S
+							ON A.SubjectId = S.Id
+						JOIN AccessLevels as C
+							ON A.AccessLevelId = C.Id
+					WHERE A.{1} IS NOT 'Unknown' """.format(GROUP_COLUMNS[by], METRIC_COLUMNS[metric])
+	results = cur.execute(statement).fetchall()
+	conn.close()
+
+	values = {}
+	for group, access_level, value in results:
+		values.setdefault(group, {'Open Access': [], 'Subscription Required': []})[access_level].append(value)
+
+	samples = {}
+	for group in sorted(values):
+		samples[group] = (np.array(values[group]['Open Access'], dtype=float), np.array(values[group]['Subscription Required'], dtype=float))
+	return samples
+
+
+# function to read the median off histograms of resampled values
+# input: sorted distinct values, matrix of counts (one row per resample, one column per value), number of values per resample
+# return: numpy array of medians, one per row
+def histogram_median(support, counts, n):
+	cumulative = np.cumsum(counts, axis=1)
+	# the value at sorted position i is the first one whose cumulative count is greater than i
+	lower = support[np.count_nonzero(cumulative <= (n - 1) // 2, axis=1)]
+	upper = support[np.count_nonzero(cumulative <= n // 2, axis=1)]
+	return (lower + upper) / 2
+
+
+# function to turn the two access levels' values into histograms over their shared distinct values
+# input: open access values, subscription values
+# return: tuple of (sorted distinct values, open access counts, subscription counts)
+def value_histograms(open_values, subscription_values):
+	support, codes = np.unique(np.concatenate([open_values, subscription_values]), return_inverse=True)
+	open_counts = np.bincount(codes[:len(open_values)], minlength=len(support))
+	subscription_counts = np.bincount(codes[len(open_values):], minlength=len(support))
+	return support, open_counts, subscription_counts
+
+
+# function to run one block of bootstrap and permutation resamples (runs in a worker process)
+# input: sorted distinct values, open access counts, subscription counts (see value_histograms), number of resamples, random seed
+# return: tuple of (numpy array of bootstrap median differences, number of permutations at least as extreme as observed)
+def resample_task(support, open_counts, subscription_counts, n_resamples, seed):
+	rng = np.random.default_rng(seed)
+	n_open = int(open_counts.sum())
+	n_subscription = int(subscription_counts.sum())
+	pooled_counts = open_counts + subscription_counts
+	observed = abs(histogram_median(support, open_counts[np.newaxis], n_open)[0] - 
+				   histogram_median(support, subscription_counts[np.newaxis], n_subscription)[0])
+
+	differences = []
+	extreme = 0
+	rows = max(1, BLOCK_ELEMENTS // len(support))
+	for start in range(0, n_resamples, rows):
+		k = min(rows, n_resamples - start)
+
+		# bootstrap: drawing n values with replacement is a multinomial draw over the distinct values
+		open_boot = rng.multinomial(n_open, open_counts / n_open, size=k)
+		subscription_boot = rng.multinomial(n_subscription, subscription_counts / n_subscription, size=k)
+		differences.append(histogram_median(support, open_boot, n_open) - histogram_median(support, subscription_boot, n_subscription))
+
+		# permutation: shuffling the access labels deals n_open of the pooled values to open access (hypergeometric draw)
+		open_perm = rng.multivariate_hypergeometric(pooled_counts, n_open, size=k)
+		permuted = histogram_median(support, open_perm, n_open) - histogram_median(support, pooled_counts - open_perm, n_subscription)
+		extreme += int(np.count_nonzero(np.abs(permuted) >= observed - 1e-9))
+
+	return np.concatenate(differences), extreme
+
+
+# function to compare open access and subscription articles, overall or within each subject, year or subject and year
+# input: database name, metric ('citations' or 'influential'), grouping (None, 'subject', 'year' or 'subject_year'),
+#        number of resamples, random seed, confidence level, number of worker processes (None = one per CPU),
+#        optional process pool to reuse across several calls (workers is ignored when it is given)
+# return: a list of AccessComparison class instances, one per group that has articles of both access levels
+def compare_access(dbname, metric='citations', by=None, n_resamples=N_RESAMPLES, seed=0, confidence=0.95, workers=None, executor=None):
+	unique_ident = "{}_{}_{}_{}_{}_{}".format(get_data_version(dbname), metric, by, n_resamples, seed, confidence)
+	if unique_ident in STATS_CACHE:
+		return [AccessComparison(*row) for row in STATS_CACHE[unique_ident]]
+
+	samples = load_access_samples(dbname, metric, by)
+	groups = [group for group in samples if len(samples[group][0]) > 0 and len(samples[group][1]) > 0]
+
+	# split every group's resamples into fixed-size tasks, each with its own independent random stream
+	tasks = []
+	for group in groups:
+		for start in range(0, n_resamples, TASK_SIZE):
+			tasks.append((group, min(TASK_SIZE, n_resamples - start)))
+	seeds = np.random.SeedSequence(seed).spawn(len(tasks))
+	histograms = {group: value_histograms(*samples[group]) for group in groups}
+	arguments = [[histograms[group][i] for group, n in tasks] for i in range(3)] + [[n for group, n in tasks], seeds]
+
+	if executor is not None:
+		results = list(executor.map(resample_task, *arguments))
+	elif workers == 1:
+		results = list(map(resample_task, *arguments))
+	else:
+		with ProcessPoolExecutor(max_workers=workers) as executor:
+			results = list(executor.map(resample_task, *arguments))
+
+	rows = []
+	alpha = (1 - confidence) / 2
+	for group in groups:
+		group_results = [result for task, result in zip(tasks, results) if task[0] == group]
+		differences = np.concatenate([result[0] for result in group_results])
+		extreme = sum(result[1] for result in group_results)
+
+		open_values, subscription_values = samples[group]
+		open_median = float(np.median(open_values))
+		subscription_median = float(np.median(subscription_values))
+		ci_low, ci_high = np.quantile(differences, [alpha, 1 - alpha])
+		p_value = (extreme + 1) / (n_resamples + 1)
+		rows.append([group, len(open_values), len(subscription_values), open_median, subscription_median,
+					 open_median - subscription_median, float(ci_low), float(ci_high), p_value])
+
+	STATS_CACHE[unique_ident] = rows
+	dumped_json_cache = json.dumps(STATS_CACHE)
+	fw = open(STATS_CACHE_FNAME, "w")
+	fw.write(dumped_json_cache)
+	fw.close()
+	return [AccessComparison(*row) for row in rows]
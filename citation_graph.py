@@ -0,0 +1,155 @@
+# import statements
+import sqlite3
+import itertools
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+
+
+### Citation graph analytics ###
+# these functions read the Papers and Citations tables built by final_project.populate_db
+# the graph is held as a sparse adjacency matrix (rows = citing paper, columns = cited paper)
+
+class CitationGraph():
+	def __init__(self, paper_ids, article_ids, adjacency):
+		self.paper_ids = paper_ids          # Papers.Id for each row/column of the matrix
+		self.article_ids = article_ids      # Articles.Id for each paper, 0 if the paper is not in the corpus
+		self.adjacency = adjacency          # scipy csr matrix, adjacency[i, j] = 1 if paper i cites paper j
+		self.in_corpus = article_ids > 0
+
+	def __str__(self):
+		return "Citation graph: {} paper(s), {} citation(s), {} corpus article(s)".format(len(self.paper_ids), self.adjacency.nnz,
+																						  int(self.in_corpus.sum()))
+
+	# function to count citations each paper receives from other articles in the corpus
+	# input: nothing
+	# return: numpy array of citation counts, one per paper
+	def in_corpus_citation_counts(self):
+		return self.adjacency.T.dot(self.in_corpus.astype(np.int64))
+
+	# function to compute PageRank scores with power iteration over the sparse matrix
+	# input: damping factor, convergence tolerance (L1 norm), maximum number of iterations
+	# return: numpy array of PageRank scores, one per paper (scores sum to 1)
+	def pagerank(self, damping=0.85, tol=1e-10, max_iter=100):
+		n = self.adjacency.shape[0]
+		if n == 0:
+			return np.zeros(0)
+
+		out_degree = np.asarray(self.adjacency.sum(axis=1)).ravel()
+		dangling = out_degree == 0
+		inverse_degree = np.zeros(n)
+		inverse_degree[~dangling] = 1.0 / out_degree[~dangling]
+		transposed = self.adjacency.T.tocsr()
+
+		rank = np.full(n, 1.0 / n)
+		for _ in range(max_iter):
+			# rank that leaves dangling papers (no references) is spread evenly, like the teleport term
+			leftover = damping * rank[dangling].sum() + (1.0 - damping)
+			new_rank = damping * transposed.dot(rank * inverse_degree) + leftover / n
+			if np.abs(new_rank - rank).sum() < tol:
+				return new_rank
+			rank = new_rank
+		return rank
+
+	# function to group corpus articles that are cited together by the same papers (co-citation)
+	# input: minimum number of shared citing papers needed to link two articles
+	# return: list of clusters (lists of Articles.Id), largest first; articles with no co-citation links are left out
+	def cocitation_clusters(self, min_shared=2):
+		columns = np.flatnonzero(self.in_corpus)
+		cited = self.adjacency.tocsc()[:, columns]
+		cocitation = (cited.T.dot(cited)).tocoo()
+
+		keep = (cocitation.row != cocitation.col) & (cocitation.data >= min_shared)
+		links = sp.csr_matrix((np.ones(keep.sum()), (cocitation.row[keep], cocitation.col[keep])), shape=cocitation.shape)
+		n_components, labels = connected_components(links, directed=False)
+
+		sizes = np.bincount(labels, minlength=n_components)
+		order = np.argsort(labels, kind='stable')
+		groups = np.split(self.article_ids[columns][order], np.cumsum(sizes)[:-1])
+		clusters = [sorted(group.tolist()) for group in groups if len(group) > 1]
+		clusters.sort(key=len, reverse=True)
+		return clusters
+
+
+# function to load the citation graph from the database
+# input: database name
+# return: a CitationGraph instance
+def load_citation_graph(dbname):
+	conn = sqlite3.connect(dbname)
+	cur = conn.cursor()
+
+	# rows are streamed straight into numpy arrays, so large edge tables never become lists of tuples
+	cur.execute("SELECT Id, IFNULL(ArticleId, 0) FROM Papers ORDER BY Id")
+	papers = np.fromiter(itertools.chain.from_iterable(cur), dtype=np.int64).reshape(-1, 2)
+	cur.execute("SELECT CitingId, CitedId FROM Citations")
+	edges = np.fromiter(itertools.chain.from_iterable(cur), dtype=np.int64).reshape(-1, 2)
+	conn.close()
+
+	paper_ids = papers[:, 0]
+	n = len(paper_ids)
+	rows = np.searchsorted(paper_ids, edges[:, 0])
+	cols = np.searchsorted(paper_ids, edges[:, 1])
+	adjacency = sp.csr_matrix((np.ones(len(edges), dtype=np.int64), (rows, cols)), shape=(n, n))
+	return CitationGraph(paper_ids, papers[:, 1], adjacency)
+
+
+# function to compute graph-based impact for each corpus article
+# the graph is loaded and ranked once here, so callers can pass the result to several of the grouping functions below
+# input: database name
+# return: tuple of numpy arrays (article ids, in-corpus citations, PageRank scores), one entry per corpus article
+def get_article_graph_impact(dbname):
+	graph = load_citation_graph(dbname)
+	counts = graph.in_corpus_citation_counts()[graph.in_corpus]
+	ranks = graph.pagerank()[graph.in_corpus]
+	return graph.article_ids[graph.in_corpus], counts, ranks
+
+
+# function to average graph-based impact over a grouping of articles
+# input: database name, SQL statement returning (article id, group name) pairs, result of get_article_graph_impact
+# return: list of tuples (group name, average in-corpus citations, average PageRank score)
+def group_graph_impact(dbname, statement, impact):
+	article_ids, counts, ranks = impact
+
+	conn = sqlite3.connect(dbname)
+	groups = conn.execute(statement).fetchall()
+	conn.close()
+
+	# lookup table from article id to group number, so every article is mapped in one vectorized step
+	names = sorted(set(row[1] for row in groups))
+	name_codes = {name: i for i, name in enumerate(names)}
+	lookup = np.full(max([row[0] for row in groups] + [int(article_ids.max(initial=0))]) + 1, -1, dtype=np.int64)
+	for article_id, name in groups:
+		lookup[article_id] = name_codes[name]
+	codes = lookup[article_ids]
+	grouped = codes >= 0
+
+	sizes = np.bincount(codes[grouped], minlength=len(names))
+	avg_counts = np.bincount(codes[grouped], weights=counts[grouped], minlength=len(names)) / np.maximum(sizes, 1)
+	avg_ranks = np.bincount(codes[grouped], weights=ranks[grouped], minlength=len(names)) / np.maximum(sizes, 1)
+	return [(names[i], float(avg_counts[i]), float(avg_ranks[i])) for i in range(len(names)) if sizes[i] > 0]
+
+
+# function to compare graph-based impact by access level
+# input: database name, optional result of get_article_graph_impact (computed here if not given)
+# return: list of tuples (access level, average in-corpus citations, average PageRank score)
+def get_graph_impact_by_access(dbname, impact=None):
+	if impact is None:
+		impact = get_article_graph_impact(dbname)
+	statement = """SELECT A.Id, C.AccessLevel
+					FROM Articles as A
+					JOIN AccessLevels as C
+					ON A.AccessLevelId = C.Id """
+	return group_graph_impact(dbname, statement, impact)
+
+
+# function to compare graph-based impact by subject
+# input: database name, optional result of get_article_graph_impact (computed here if not given)
+# return: list of tuples (subject, average in-corpus citations, average PageRank score)
+def get_graph_impact_by_subject(dbname, impact=None):
+	if impact is None:
+		impact = get_article_graph_impact(dbname)
+	statement = """SELECT A.Id, S.Subject
+					FROM Articles as A
+					JOIN Subjects as S
+					ON A.SubjectId = S.Id """
+	return group_graph_impact(dbname, statement, impact)
@@ -0,0 +1,217 @@
+# import statements
+import os
+import shutil
+import sqlite3
+import numpy as np
+import pyarrow as pa
+
+
+### Columnar export of the article corpus ###
+# the Articles table (joined with its subject, access level and journal) is written as Arrow IPC files,
+# partitioned into one directory per subject and publication year: <export_dir>/subject=<subject>/year=<year>/part-<n>.arrow
+# Arrow files can be memory-mapped, so loading them back does not copy or parse the data
+
+EXPORT_DIR = 'articles_export'
+BATCH_SIZE = 10000
+
+EXPORT_SCHEMA = pa.schema([
+	('id', pa.int64()),
+	('doi', pa.string()),
+	('title', pa.string()),
+	('subject', pa.dictionary(pa.int32(), pa.string())),
+	('year', pa.int16()),
+	('pub_date', pa.dictionary(pa.int32(), pa.string())),
+	('journal', pa.dictionary(pa.int32(), pa.string())),
+	('publisher', pa.dictionary(pa.int32(), pa.string())),
+	('access_level', pa.dictionary(pa.int32(), pa.string())),
+	('author', pa.dictionary(pa.int32(), pa.string())),
+	('author_count', pa.int16()),
+	('citations', pa.int32()),
+	('influential', pa.int32()),
+])
+
+
+# function to turn a publication date string into a year
+# input: PubDate value from the Articles table
+# return: integer year, or None if the date is unknown
+def parse_year(pub_date):
+	if pub_date is not None and str(pub_date).isdigit():
+		return int(pub_date)
+	return None
+
+
+# function to turn a citation metric into an integer
+# input: CitationCount or InfluentialCitations value from the Articles table
+# return: integer value, or None if the metric is 'Unknown'
+def parse_metric(value):
+	if isinstance(value, int):
+		return value
+	return None
+
+
+# function to build one Arrow record batch from rows of the export query
+# input: list of rows (tuples in the same order as EXPORT_SCHEMA)
+# return: a pyarrow RecordBatch
+def rows_to_batch(rows):
+	columns = list(zip(*rows))
+	arrays = []
+	for i, field in enumerate(EXPORT_SCHEMA):
+		if pa.types.is_dictionary(field.type):
+			arrays.append(pa.array(columns[i], pa.string()).dictionary_encode())
+		else:
+			arrays.append(pa.array(columns[i], field.type))
+	return pa.RecordBatch.from_arrays(arrays, schema=EXPORT_SCHEMA)
+
+
+# function to write the article corpus to partitioned columnar files
+# rows are streamed from SQLite in batches, ordered by partition, so only one batch is held in memory at a time
+# input: database name, directory to write to, maximum number of rows per file
+# return: number of articles written
+def export_corpus(dbname, export_dir=EXPORT_DIR, batch_size=BATCH_SIZE):
+	conn = sqlite3.connect(dbname)
+	cur = conn.cursor()
+
+	statement = """SELECT A.Id, A.DOI, A.Title, S.Subject, A.PubDate, J.Name, A.Publisher, C.AccessLevel, A.Author,
+						(SELECT COUNT(*) FROM ArticleAuthors as AA WHERE AA.ArticleId = A.Id),
+						A.CitationCount, A.InfluentialCitations
+					FROM Articles as A
+						JOIN Subjects as S
+							ON A.SubjectId = S.Id
+						JOIN AccessLevels as C
+							ON A.AccessLevelId = C.Id
+						JOIN Journals as J
+							ON A.JournalId = J.Id
+					ORDER BY S.Subject, A.PubDate, A.Id """
+	cur.execute(statement)
+
+	# clear out partitions from an earlier export, so no stale files are loaded back
+	if os.path.isdir(export_dir):
+		for name in os.listdir(export_dir):
+			if name.startswith('subject='):
+				shutil.rmtree(os.path.join(export_dir, name))
+
+	# different PubDate strings can share a partition (e.g. '' and 'n/a' are both year=unknown) without being
+	# next to each other in the sort order, so file numbers are counted per partition
+	total = 0
+	part_numbers = {}
+	while True:
+		rows = cur.fetchmany(batch_size)
+		if not rows:
+			break
+
+		# split the batch wherever the (subject, year) partition changes
+		rows = [(row[0], row[1], row[2], row[3], parse_year(row[4]), row[4], row[5], row[6], row[7], row[8], row[9],
+				 parse_metric(row[10]), parse_metric(row[11])) for row in rows]
+		start = 0
+		while start < len(rows):
+			key = (rows[start][3], rows[start][4])
+			end = start
+			while end < len(rows) and (rows[end][3], rows[end][4]) == key:
+				end += 1
+
+			part_number = part_numbers.setdefault(key, 0)
+			year = 'unknown' if key[1] is None else key[1]
+			directory = os.path.join(export_dir, 'subject={}'.format(key[0]), 'year={}'.format(year))
+			os.makedirs(directory, exist_ok=True)
+
+			# every file holds a single batch, so each one has its own string dictionaries
+			path = os.path.join(directory, 'part-{}.arrow'.format(part_number))
+			with pa.OSFile(path, 'wb') as sink:
+				with pa.ipc.new_file(sink, EXPORT_SCHEMA) as writer:
+					writer.write_batch(rows_to_batch(rows[start:end]))
+			part_numbers[key] += 1
+			total += end - start
+			start = end
+
+	conn.close()
+	return total
+
+
+# function to memory-map exported files back into a single Arrow table
+# partitions that are not requested are skipped without opening their files
+# input: export directory, optional list of subjects, optional list of years (integers)
+# return: a pyarrow Table with the EXPORT_SCHEMA columns
+def load_corpus(export_dir=EXPORT_DIR, subjects=None, years=None):
+	# only partition directories and Arrow files are read, so other files in the export directory are ignored
+	tables = []
+	for subject_dir in sorted(os.listdir(export_dir)):
+		if not subject_dir.startswith('subject='):
+			continue
+		subject = subject_dir.split('=', 1)[1]
+		if subjects is not None and subject not in subjects:
+			continue
+		for year_dir in sorted(os.listdir(os.path.join(export_dir, subject_dir))):
+			if not year_dir.startswith('year='):
+				continue
+			year = year_dir.split('=', 1)[1]
+			if years is not None and (not year.isdigit() or int(year) not in years):
+				continue
+			directory = os.path.join(export_dir, subject_dir, year_dir)
+			for file_name in sorted(os.listdir(directory)):
+				if not file_name.endswith('.arrow'):
+					continue
+				source = pa.memory_map(os.path.join(directory, file_name), 'r')
+				tables.append(pa.ipc.open_file(source).read_all())
+
+	if not tables:
+		return EXPORT_SCHEMA.empty_table()
+	return pa.concat_tables(tables)
+
+
+# function to number the groups in a column, across every chunk of the table
+# input: a column (pyarrow ChunkedArray) of dictionary-encoded strings or integers
+# return: tuple of (numpy array of group numbers, one per row; sorted list of group names)
+def group_codes(column):
+	if pa.types.is_dictionary(column.type):
+		names = sorted(set(name for chunk in column.chunks for name in chunk.dictionary.to_pylist()))
+		name_codes = {name: i for i, name in enumerate(names)}
+		codes = []
+		for chunk in column.chunks:
+			# map this chunk's dictionary onto the shared group numbers, then translate all of its indices at once
+			chunk_codes = np.array([name_codes[name] for name in chunk.dictionary.to_pylist()], dtype=np.int64)
+			codes.append(chunk_codes[chunk.indices.to_numpy(zero_copy_only=False)])
+		codes = np.concatenate(codes) if codes else np.zeros(0, dtype=np.int64)
+		return codes, names
+
+	values = column.to_numpy()
+	names, codes = np.unique(values, return_inverse=True)
+	return codes, names.tolist()
+
+
+# function to average metrics for each group, skipping articles where the metric is unknown
+# input: a loaded corpus table, name of the column to group by, list of metric column names
+# return: list of tuples (group name, average of each metric), sorted by group name
+def group_averages(table, group_column, metric_columns):
+	codes, names = group_codes(table.column(group_column))
+
+	averages = []
+	measured = np.zeros(len(names), dtype=np.int64)
+	for metric in metric_columns:
+		values = np.asarray(table.column(metric).to_numpy(), dtype=float)
+		known = ~np.isnan(values)
+		sizes = np.bincount(codes[known], minlength=len(names))
+		averages.append(np.bincount(codes[known], weights=values[known], minlength=len(names)) / np.maximum(sizes, 1))
+		measured = np.maximum(measured, sizes)
+	return [tuple([names[i]] + [float(column[i]) for column in averages]) for i in range(len(names)) if measured[i] > 0]
+
+
+# function to get average citations by access level from an export (same result as get_citations_by_access)
+# input: a loaded corpus table
+# return: list of tuples (access level, average citations)
+def export_citations_by_access(table):
+	return group_averages(table, 'access_level', ['citations'])
+
+
+# function to get average influential citations by access level from an export (same result as get_influence_by_access)
+# input: a loaded corpus table
+# return: list of tuples (access level, average influential citations)
+def export_influence_by_access(table):
+	return group_averages(table, 'access_level', ['influential'])
+
+
+# function to get average citations by publication date from an export (same result as get_citations_by_year)
+# groups on the raw PubDate string, so unknown dates such as '' and 'n/a' stay separate, as in the SQL query
+# input: a loaded corpus table
+# return: list of tuples (PubDate, average citations)
+def export_citations_by_year(table):
+	return group_averages(table, 'pub_date', ['citations'])
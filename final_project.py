@@ -5,8 +5,13 @@ from secrets import *
 import sqlite3
 import random
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 import plotly.plotly as py
 import plotly.graph_objs as go
+from citation_graph import *
+from corpus_export import *
+from access_stats import *
 
 
 ### Define global variables - will use these several times ###
@@ -109,7 +114,7 @@ def get_impact_data(doi):
 		return CACHE_DICTION[unique_ident]
 
 
-### Set up Article and Subject classes ###
+### Set up Article, Subject, Journal and Author classes ###
 # these classes will take queried data from the articles database
 # will prepare data for visualization
 
@@ -134,6 +139,32 @@ class Article():
 		return "Subject: {} ({}), Access: {} - {} citation(s), {} influential citation(s)".format(self.subject, self.year, self.access, 
 																								self.citations, self.influential)
 
+class CitationRecord():
+	label = 'Record'
+
+	def __init__(self, name, article_count, measured_count, citation_total, influential_total, h_index):
+		self.name = name
+		self.articles = article_count
+		self.measured = measured_count
+		self.citations = citation_total
+		self.influential = influential_total
+		self.h_index = h_index
+
+	def average_citations(self):
+		if self.measured == 0:
+			return 0
+		return self.citations / self.measured
+
+	def __str__(self):
+		return "{}: {} - {} article(s), {} citation(s) ({:.1f} average), {} influential citation(s), h-index {}".format(self.label, 
+				self.name, self.articles, self.citations, self.average_citations(), self.influential, self.h_index)
+
+class Journal(CitationRecord):
+	label = 'Journal'
+
+class Author(CitationRecord):
+	label = 'Author'
+
 
 ### Process API Data ###
 
@@ -148,14 +179,15 @@ def process_api_data(search_subject):
 		doi = article['doi'] 
 		title = article['title'].replace('\n', '')
 		author = article['creators'][0]['creator']
+		authors = [creator['creator'] for creator in article['creators']]
 		date = article['publicationDate'][:4]
 		journal = article['publicationName']
 		subject = search_subject
 		publisher = article['publisher']
 		open_access = article['openaccess']
 		# add to dictionary
-		article_dict[doi] = {'title':title, 'author':author, 'date':date, 'journal':journal, 'subject':subject, 'publisher':publisher, 
-							'open_access':open_access}
+		article_dict[doi] = {'title':title, 'author':author, 'authors':authors, 'date':date, 'journal':journal, 'subject':subject, 
+							'publisher':publisher, 'open_access':open_access}
 		
 
 	plos = get_plos_data(search_subject)
@@ -164,9 +196,11 @@ def process_api_data(search_subject):
 		try:
 			title = article['title_display'].replace('\n', '')
 			author = article['author_display'][0]
+			authors = article['author_display']
 		except:
 			title = 'Unknown'
 			author = 'Unknown'
+			authors = []
 		date = article['publication_date'][:4]
 		try:
 			journal = article['journal']
@@ -175,8 +209,8 @@ def process_api_data(search_subject):
 		subject = search_subject
 		publisher = "PLOS"
 		open_access = 'true' 
-		article_dict[doi] = {'title':title, 'author':author, 'date':date, 'journal':journal, 'subject':subject, 'publisher':publisher, 
-							'open_access':open_access}
+		article_dict[doi] = {'title':title, 'author':author, 'authors':authors, 'date':date, 'journal':journal, 'subject':subject, 
+							'publisher':publisher, 'open_access':open_access}
 
 
 	for doi in article_dict.keys():
@@ -187,8 +221,18 @@ def process_api_data(search_subject):
 		except:
 			citation_count = 'Unknown'
 			influential_citations = 'Unknown'
+		# keep the citation edges (as Semantic Scholar paper ids) so they can be stored in the citation graph
+		try:
+			paper_id = impact['paperId']
+			citing = [paper['paperId'] for paper in impact['citations'] if paper.get('paperId')]
+			references = [paper['paperId'] for paper in impact['references'] if paper.get('paperId')]
+		except:
+			paper_id = None
+			citing = []
+			references = []
 		# update dictionary with the metric data
-		article_dict[doi]['metrics'] = {'citations':citation_count, 'influential':influential_citations}
+		article_dict[doi]['metrics'] = {'citations':citation_count, 'influential':influential_citations, 'paper_id':paper_id, 
+										'citing':citing, 'references':references}
 
 	return article_dict
 
@@ -209,6 +253,12 @@ def create_db(dbname):
 	drop_tables = """ DROP TABLE IF EXISTS 'AccessLevels';            
 					DROP TABLE IF EXISTS 'Articles';
 					DROP TABLE IF EXISTS 'Subjects';
+					DROP TABLE IF EXISTS 'Papers';
+					DROP TABLE IF EXISTS 'Citations';
+					DROP TABLE IF EXISTS 'Journals';
+					DROP TABLE IF EXISTS 'Authors';
+					DROP TABLE IF EXISTS 'ArticleAuthors';
+					DROP TABLE IF EXISTS 'DataVersion';
 					"""
 
 	create_tables = """CREATE TABLE 'AccessLevels' (
@@ -227,12 +277,64 @@ def create_db(dbname):
 								'Publisher' TEXT,
 								'AccessLevelId' INTEGER,
 								'CitationCount' BLOB,
-								'InfluentialCitations' BLOB
+								'InfluentialCitations' BLOB,
+								'JournalId' INTEGER
 								);
 
+						CREATE INDEX 'ArticlesByJournal' ON 'Articles' ('JournalId');
+
 						CREATE TABLE 'Subjects' (
 							'Id' INTEGER PRIMARY KEY AUTOINCREMENT,
-							'Subject' TEXT)
+							'Subject' TEXT);
+
+						CREATE TABLE 'Papers' (
+							'Id' INTEGER PRIMARY KEY AUTOINCREMENT,
+							'PaperKey' TEXT UNIQUE,
+							'ArticleId' INTEGER
+							);
+
+						CREATE TABLE 'Citations' (
+							'CitingId' INTEGER,
+							'CitedId' INTEGER,
+							PRIMARY KEY ('CitingId', 'CitedId')
+							) WITHOUT ROWID;
+
+						CREATE INDEX 'CitationsByCited' ON 'Citations' ('CitedId', 'CitingId');
+
+						CREATE TABLE 'Journals' (
+							'Id' INTEGER PRIMARY KEY AUTOINCREMENT,
+							'Name' TEXT,
+							'NameKey' TEXT UNIQUE,
+							'ArticleCount' INTEGER DEFAULT 0,
+							'MeasuredCount' INTEGER DEFAULT 0,
+							'CitationTotal' INTEGER DEFAULT 0,
+							'InfluentialTotal' INTEGER DEFAULT 0,
+							'HIndex' INTEGER DEFAULT 0
+							);
+
+						CREATE TABLE 'Authors' (
+							'Id' INTEGER PRIMARY KEY AUTOINCREMENT,
+							'Name' TEXT,
+							'NameKey' TEXT UNIQUE,
+							'ArticleCount' INTEGER DEFAULT 0,
+							'MeasuredCount' INTEGER DEFAULT 0,
+							'CitationTotal' INTEGER DEFAULT 0,
+							'InfluentialTotal' INTEGER DEFAULT 0,
+							'HIndex' INTEGER DEFAULT 0
+							);
+
+						CREATE TABLE 'ArticleAuthors' (
+							'ArticleId' INTEGER,
+							'AuthorId' INTEGER,
+							'AuthorOrder' INTEGER,
+							PRIMARY KEY ('ArticleId', 'AuthorId')
+							) WITHOUT ROWID;
+
+						CREATE INDEX 'ArticleAuthorsByAuthor' ON 'ArticleAuthors' ('AuthorId', 'ArticleId');
+
+						CREATE TABLE 'DataVersion' (
+							'Version' INTEGER
+							);
 							"""
 
 	# call execute statements to create new tables
@@ -243,7 +345,66 @@ def create_db(dbname):
 	conn.close()
 
 
-# function to populate all three tables in database (AccessLevels, Subjects, Articles)
+# function to look up the integer id for a Semantic Scholar paper, adding it to the Papers table if it is new
+# input: database cursor, dictionary of paper ids already seen (paper key:id), Semantic Scholar paper id
+# return: integer id from the Papers table
+def get_paper_id(cur, paper_ids, paper_key):
+	if paper_key not in paper_ids:
+		cur.execute("INSERT INTO Papers ('PaperKey') VALUES (?)", (paper_key,))
+		paper_ids[paper_key] = cur.lastrowid
+	return paper_ids[paper_key]
+
+
+# function to normalize a journal or author name, so loading and lookups match names the same way
+# input: a name
+# return: the name with surrounding and repeated whitespace removed and case folded (stored in the NameKey column)
+def normalize_name(name):
+	return ' '.join(name.split()).casefold()
+
+
+# function to look up the integer id for a journal or author name, adding it to the Journals or Authors table if it is new
+# input: database cursor, table name ('Journals' or 'Authors'), dictionary of ids already seen (name key:id), name
+# return: integer id from the table
+def get_name_id(cur, table, name_ids, name):
+	name_key = normalize_name(name)
+	if name_key not in name_ids:
+		cur.execute("INSERT INTO {} ('Name', 'NameKey') VALUES (?, ?)".format(table), (name.strip(), name_key))
+		name_ids[name_key] = cur.lastrowid
+	return name_ids[name_key]
+
+
+# function to add one newly inserted article to the running metrics of a journal or author
+# the h-index can grow by at most one per article, so only that one step is checked (using the entity's own articles)
+# input: database cursor, table name ('Journals' or 'Authors'), journal/author id, citation count and influential count of the article
+# return: nothing
+def update_entity_metrics(cur, table, entity_id, citations, influential):
+	if citations == 'Unknown':
+		statement = "UPDATE {} SET ArticleCount = ArticleCount + 1 WHERE Id = ?".format(table)
+		cur.execute(statement, (entity_id,))
+		return
+
+	statement = """UPDATE {} SET ArticleCount = ArticleCount + 1, MeasuredCount = MeasuredCount + 1, 
+					CitationTotal = CitationTotal + ?, InfluentialTotal = InfluentialTotal + ?
+					WHERE Id = ?""".format(table)
+	cur.execute(statement, (citations, influential, entity_id))
+
+	if table == 'Journals':
+		articles = """Articles as A
+						WHERE A.JournalId = Journals.Id"""
+	else:
+		articles = """ArticleAuthors as AA
+						JOIN Articles as A
+						ON AA.ArticleId = A.Id
+						WHERE AA.AuthorId = Authors.Id"""
+	statement = """UPDATE {0} SET HIndex = HIndex + 1
+					WHERE Id = ? AND ? > HIndex
+					AND (SELECT COUNT(*) FROM {1}
+						AND A.CitationCount IS NOT 'Unknown' AND A.CitationCount > {0}.HIndex) > HIndex
+				""".format(table, articles)
+	cur.execute(statement, (entity_id, citations))
+
+
+# function to populate all tables in database (AccessLevels, Subjects, Articles, Papers, Citations, Journals, Authors, ArticleAuthors, DataVersion)
 # input: database name
 # return: nothing
 def populate_db(dbname):
@@ -267,6 +428,9 @@ def populate_db(dbname):
 					""".format(subject)
 		cur.execute(statement)
 
+	paper_ids = {}
+	journal_ids = {}
+	author_ids = {}
 	for doi in ARTICLE_DICT.keys():
 		if ARTICLE_DICT[doi]['open_access'] == 'false':
 			access_id_statement = 'SELECT Id FROM AccessLevels WHERE AccessLevel = "Subscription Required"'
@@ -278,12 +442,43 @@ def populate_db(dbname):
 		subject_statement = 'SELECT Id FROM Subjects WHERE Subject = "{}"'.format(ARTICLE_DICT[doi]['subject'])
 		subject = cur.execute(subject_statement).fetchone()[0]
 		
+		journal_id = get_name_id(cur, 'Journals', journal_ids, ARTICLE_DICT[doi]['journal'])
+
 		statement = """INSERT INTO Articles 
-						VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+						VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
 					"""
 		values = (None, doi, ARTICLE_DICT[doi]['title'], ARTICLE_DICT[doi]['author'], ARTICLE_DICT[doi]['date'], ARTICLE_DICT[doi]['journal'], 
-				  subject, ARTICLE_DICT[doi]['publisher'], access_id, ARTICLE_DICT[doi]['metrics']['citations'], ARTICLE_DICT[doi]['metrics']['influential'])
+				  subject, ARTICLE_DICT[doi]['publisher'], access_id, ARTICLE_DICT[doi]['metrics']['citations'], ARTICLE_DICT[doi]['metrics']['influential'], 
+				  journal_id)
 		cur.execute(statement, values)
+		article_id = cur.lastrowid
+
+		# link every author of the article (not only the first), then add the article to the journal and author metrics
+		citations = ARTICLE_DICT[doi]['metrics']['citations']
+		influential = ARTICLE_DICT[doi]['metrics']['influential']
+		update_entity_metrics(cur, 'Journals', journal_id, citations, influential)
+
+		author_list = []
+		for name in ARTICLE_DICT[doi]['authors']:
+			author_id = get_name_id(cur, 'Authors', author_ids, name)
+			if author_id not in author_list:
+				author_list.append(author_id)
+		for order, author_id in enumerate(author_list):
+			cur.execute("INSERT INTO ArticleAuthors VALUES (?, ?, ?)", (article_id, author_id, order + 1))
+			update_entity_metrics(cur, 'Authors', author_id, citations, influential)
+
+		# store the article's citations and references as integer edges (citing paper -> cited paper)
+		metrics = ARTICLE_DICT[doi]['metrics']
+		if metrics.get('paper_id'):
+			paper_id = get_paper_id(cur, paper_ids, metrics['paper_id'])
+			cur.execute("UPDATE Papers SET ArticleId = ? WHERE Id = ?", (article_id, paper_id))
+
+			edges = [(get_paper_id(cur, paper_ids, citing), paper_id) for citing in metrics['citing']]
+			edges += [(paper_id, get_paper_id(cur, paper_ids, cited)) for cited in metrics['references']]
+			cur.executemany("INSERT OR IGNORE INTO Citations VALUES (?, ?)", edges)
+
+	# record a new data version, so cached statistics (see access_stats.py) are recomputed
+	cur.execute("INSERT INTO DataVersion VALUES (?)", (time.time_ns(),))
 
 	conn.commit()
 	conn.close()
@@ -344,6 +539,38 @@ def get_citations_by_year(dbname):
 	conn.close()
 	return results
 
+# function to look up the precomputed metrics for one journal (an indexed lookup on the journal name)
+# input: database name, journal name (case and extra spaces are ignored)
+# return: a Journal class instance, or None if the journal is not in the database
+def get_journal_metrics(dbname, journal_name):
+	conn = sqlite3.connect(dbname)
+	cur = conn.cursor()
+
+	statement = """SELECT Name, ArticleCount, MeasuredCount, CitationTotal, InfluentialTotal, HIndex
+					FROM Journals
+					WHERE NameKey = ? """
+	result = cur.execute(statement, (normalize_name(journal_name),)).fetchone()
+	conn.close()
+	if result is None:
+		return None
+	return Journal(*result)
+
+# function to look up the precomputed metrics for one author (an indexed lookup on the author name)
+# input: database name, author name as it appears in the source data (case and extra spaces are ignored)
+# return: an Author class instance, or None if the author is not in the database
+def get_author_metrics(dbname, author_name):
+	conn = sqlite3.connect(dbname)
+	cur = conn.cursor()
+
+	statement = """SELECT Name, ArticleCount, MeasuredCount, CitationTotal, InfluentialTotal, HIndex
+					FROM Authors
+					WHERE NameKey = ? """
+	result = cur.execute(statement, (normalize_name(author_name),)).fetchone()
+	conn.close()
+	if result is None:
+		return None
+	return Author(*result)
+
 # function to query the database and create instances of the Subject class
 # input: name of database
 # return: a list of Subject class instances
@@ -401,6 +628,23 @@ def create_article_insts(dbname):
 	return article_obs
 
 
+# function to load an exported corpus (see corpus_export.py) and create instances of the Subject class
+# input: export directory
+# return: a list of Subject class instances, like create_subject_insts
+def create_subject_insts_from_export(export_dir):
+	table = load_corpus(export_dir)
+	return [Subject(*row) for row in group_averages(table, 'subject', ['citations', 'influential'])]
+
+
+# function to load an exported corpus and create instances of the Article class
+# input: export directory
+# return: a list of Article class instances, like create_article_insts
+def create_article_insts_from_export(export_dir):
+	table = load_corpus(export_dir)
+	columns = [table.column(name).to_pylist() for name in ['subject', 'year', 'access_level', 'citations', 'influential']]
+	return [Article(*row) for row in zip(*columns) if row[3] is not None]
+
+
 ### Present data ###
 ### Four Plotly functions to show different data presentation options ###
 
@@ -558,6 +802,15 @@ if __name__=="__main__":
 		print('Populating database articles.db...')
 		populate_db(DB_NAME)
 
+	elif len(sys.argv) > 1 and sys.argv[1] == '--export':
+		export_dir = sys.argv[2] if len(sys.argv) > 2 else EXPORT_DIR
+		print('Exporting {} to {}...'.format(DB_NAME, export_dir))
+		try:
+			count = export_corpus(DB_NAME, export_dir)
+			print('Exported {} articles.'.format(count))
+		except sqlite3.OperationalError:
+			print("The database is missing the journal tables. Please run the program with --rebuild first.")
+
 	else:
 		print('Using existing database.')
 
@@ -602,6 +855,44 @@ if __name__=="__main__":
 				data = get_citations_by_year(DB_NAME)
 				plot_citations_by_year(data)
 
+			elif user_input == 'graph':
+				try:
+					impact = get_article_graph_impact(DB_NAME)
+					access_impact = get_graph_impact_by_access(DB_NAME, impact)
+					subject_impact = get_graph_impact_by_subject(DB_NAME, impact)
+				except sqlite3.OperationalError:
+					print("The database has no citation graph yet. Please run the program with --rebuild first.")
+					continue
+				for group, avg_citations, avg_rank in access_impact + subject_impact:
+					print("{}: {:.2f} in-corpus citation(s) (average), PageRank {:.6f} (average)".format(group, avg_citations, avg_rank))
+				print('\n')
+
+			elif user_input == 'stats':
+				print('Comparing open access and subscription articles ({} resamples)...'.format(N_RESAMPLES))
+				comparisons = []
+				with ProcessPoolExecutor() as executor:
+					for grouping in [None, 'subject', 'year', 'subject_year']:
+						comparisons += compare_access(DB_NAME, by=grouping, executor=executor)
+				for each in comparisons:
+					print(each)
+				print('\n')
+
+			elif user_input == 'journal' or user_input == 'author':
+				name = input("Enter the {} name: ".format(user_input))
+				try:
+					if user_input == 'journal':
+						entity = get_journal_metrics(DB_NAME, name)
+					else:
+						entity = get_author_metrics(DB_NAME, name)
+				except sqlite3.OperationalError:
+					print("The database has no journal or author tables yet. Please run the program with --rebuild first.")
+					continue
+				if entity is None:
+					print("I'm sorry, I couldn't find that {} in the database.".format(user_input))
+				else:
+					print(entity)
+				print('\n')
+
 			elif user_input == 'list':
 				article_insts = create_article_insts(DB_NAME)
 				random_articles = random.choices(article_insts, k=25)
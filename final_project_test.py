@@ -1,5 +1,11 @@
 # You must create at least 3 test cases and use at least 15 assertions or calls to ‘fail()’
 import unittest
+import os
+import shutil
+import tempfile
+from unittest import mock
+import numpy as np
+import access_stats
 from final_project import *
 
 # Tests to show program can access data from all sources
@@ -96,6 +102,224 @@ class TestDataProcessing(unittest.TestCase):
 		self.assertEqual(type(arti[0].citations), int)
 
 
+# small hand-made set of articles, so the graph tests do not depend on the API data
+TEST_DB_NAME = 'test_articles.db'
+TEST_ARTICLES = {
+	'10.1/a': {'title':'A', 'author':'Smith, Ann', 'authors':['Smith, Ann', 'Lee, Cy'], 'date':'2015', 'journal':'Journal One', 'subject':'Law', 'publisher':'Springer',
+			   'open_access':'true', 'metrics':{'citations':3, 'influential':1, 'paper_id':'pa', 'citing':['pb', 'px', 'py'], 'references':[]}},
+	'10.1/b': {'title':'B', 'author':'Jones, Bo', 'authors':['Jones, Bo', 'Smith, Ann'], 'date':'2016', 'journal':'Journal One', 'subject':'Law', 'publisher':'Springer',
+			   'open_access':'false', 'metrics':{'citations':2, 'influential':0, 'paper_id':'pb', 'citing':['px', 'py'], 'references':['pa']}},
+	'10.1/c': {'title':'C', 'author':'Smith, Ann', 'authors':['Smith, Ann'], 'date':'2016', 'journal':'Journal Two', 'subject':'History', 'publisher':'PLOS',
+			   'open_access':'true', 'metrics':{'citations':'Unknown', 'influential':'Unknown', 'paper_id':None, 'citing':[], 'references':[]}},
+}
+
+def build_test_db():
+	ARTICLE_DICT.clear()
+	ARTICLE_DICT.update(TEST_ARTICLES)
+	create_db(TEST_DB_NAME)
+	populate_db(TEST_DB_NAME)
+
+
+# Tests to show citation edges are stored and the graph metrics can be computed from them
+class TestCitationGraph(unittest.TestCase):
+
+	def setUp(self):
+		build_test_db()
+
+	def tearDown(self):
+		os.remove(TEST_DB_NAME)
+
+	def test_edge_table(self):
+		conn = sqlite3.connect(TEST_DB_NAME)
+		cur = conn.cursor()
+		papers = cur.execute("SELECT COUNT(*) FROM Papers").fetchone()[0]
+		edges = cur.execute("SELECT COUNT(*) FROM Citations").fetchone()[0]
+		conn.close()
+
+		self.assertEqual(papers, 4)
+		self.assertEqual(edges, 5)
+
+	def test_graph_metrics(self):
+		graph = load_citation_graph(TEST_DB_NAME)
+		counts = graph.in_corpus_citation_counts()
+		ranks = graph.pagerank()
+
+		self.assertEqual(counts[graph.article_ids == 1][0], 1)
+		self.assertEqual(counts[graph.article_ids == 2][0], 0)
+		self.assertAlmostEqual(ranks.sum(), 1.0)
+		self.assertGreater(ranks[graph.article_ids == 1][0], ranks[graph.article_ids == 2][0])
+		self.assertEqual(graph.cocitation_clusters(), [[1, 2]])
+
+	def test_graph_impact_by_access(self):
+		impact = get_article_graph_impact(TEST_DB_NAME)
+		by_access = get_graph_impact_by_access(TEST_DB_NAME, impact)
+
+		self.assertEqual(len(by_access), 2)
+		self.assertEqual(by_access[0][0], 'Open Access')
+		self.assertEqual(by_access[0][1], 1.0)
+		self.assertEqual(by_access, get_graph_impact_by_access(TEST_DB_NAME))
+
+
+# Tests to show journal and author tables are filled in and their metrics are kept up to date on load
+class TestDimensionTables(unittest.TestCase):
+
+	def setUp(self):
+		build_test_db()
+
+	def tearDown(self):
+		os.remove(TEST_DB_NAME)
+
+	def test_article_authors(self):
+		conn = sqlite3.connect(TEST_DB_NAME)
+		cur = conn.cursor()
+		links = cur.execute("SELECT COUNT(*) FROM ArticleAuthors").fetchone()[0]
+		authors = cur.execute("SELECT COUNT(*) FROM Authors").fetchone()[0]
+		journals = cur.execute("SELECT COUNT(*) FROM Journals").fetchone()[0]
+		conn.close()
+
+		self.assertEqual(links, 5)
+		self.assertEqual(authors, 3)
+		self.assertEqual(journals, 2)
+
+	def test_journal_metrics(self):
+		journal = get_journal_metrics(TEST_DB_NAME, 'journal one')
+
+		self.assertEqual(journal.name, 'Journal One')
+		self.assertEqual(journal.articles, 2)
+		self.assertEqual(journal.citations, 5)
+		self.assertEqual(journal.h_index, 2)
+		self.assertIsNone(get_journal_metrics(TEST_DB_NAME, 'Not A Journal'))
+		self.assertEqual(get_journal_metrics(TEST_DB_NAME, '  JOURNAL  one ').name, 'Journal One')
+
+	def test_name_normalization(self):
+		self.assertEqual(normalize_name('  Émile   ZOLA '), normalize_name('émile zola'))
+		self.assertEqual(str(Author('Smith, Ann', 1, 1, 2, 0, 1)).split(':')[0], 'Author')
+		self.assertFalse(isinstance(Author('Smith, Ann', 1, 1, 2, 0, 1), Journal))
+
+	def test_author_metrics(self):
+		author = get_author_metrics(TEST_DB_NAME, 'Smith, Ann')
+
+		self.assertEqual(author.articles, 3)
+		self.assertEqual(author.measured, 2)
+		self.assertEqual(author.average_citations(), 2.5)
+		self.assertEqual(author.h_index, 2)
+
+
+# Tests to show the corpus can be exported to columnar files and analyzed from them
+class TestExport(unittest.TestCase):
+	
+	def setUp(self):
+		build_test_db()
+		self.export_dir = 'test_export'
+
+	def tearDown(self):
+		os.remove(TEST_DB_NAME)
+		shutil.rmtree(self.export_dir)
+
+	def test_export_partitions(self):
+		count = export_corpus(TEST_DB_NAME, self.export_dir)
+
+		self.assertEqual(count, 3)
+		self.assertEqual(sorted(os.listdir(self.export_dir)), ['subject=History', 'subject=Law'])
+		self.assertEqual(sorted(os.listdir(os.path.join(self.export_dir, 'subject=Law'))), ['year=2015', 'year=2016'])
+
+	def test_load_corpus(self):
+		export_corpus(TEST_DB_NAME, self.export_dir)
+		table = load_corpus(self.export_dir)
+		law = load_corpus(self.export_dir, subjects=['Law'], years=[2016])
+
+		self.assertEqual(table.num_rows, 3)
+		self.assertEqual(str(table.schema.field('journal').type), 'dictionary<values=string, indices=int32, ordered=0>')
+		self.assertEqual(table.column('citations').null_count, 1)
+		self.assertEqual(law.column('doi').to_pylist(), ['10.1/b'])
+
+	def test_export_unknown_dates(self):
+		# '' and 'n/a' share the year=unknown partition but are not next to each other in PubDate order
+		for i, date in enumerate(['', '', '2015', 'n/a', 'n/a', '2016']):
+			article = dict(TEST_ARTICLES['10.1/b'], date=date, metrics=dict(TEST_ARTICLES['10.1/b']['metrics'], citations=i, paper_id=None))
+			ARTICLE_DICT['10.2/{}'.format(i)] = article
+		create_db(TEST_DB_NAME)
+		populate_db(TEST_DB_NAME)
+		os.makedirs(self.export_dir)
+		open(os.path.join(self.export_dir, 'README'), 'w').close()
+
+		count = export_corpus(TEST_DB_NAME, self.export_dir, batch_size=1)
+		table = load_corpus(self.export_dir)
+
+		self.assertEqual(count, 9)
+		self.assertEqual(table.num_rows, 9)
+		self.assertEqual(len(os.listdir(os.path.join(self.export_dir, 'subject=Law', 'year=unknown'))), 4)
+		self.assertEqual(export_citations_by_year(table), get_citations_by_year(TEST_DB_NAME))
+
+	def test_export_matches_database(self):
+		export_corpus(TEST_DB_NAME, self.export_dir)
+		table = load_corpus(self.export_dir)
+		subj = create_subject_insts_from_export(self.export_dir)
+
+		self.assertEqual(export_citations_by_access(table), get_citations_by_access(TEST_DB_NAME))
+		self.assertEqual(export_citations_by_year(table), get_citations_by_year(TEST_DB_NAME))
+		self.assertEqual(len(subj), 1)
+		self.assertEqual(subj[0].avg_citations, 2.5)
+
+
+# Tests to show the open access comparison statistics are computed and cached against the data version
+class TestAccessStats(unittest.TestCase):
+
+	def setUp(self):
+		build_test_db()
+		# keep the tests' results out of the real stats cache
+		self.cache_dir = tempfile.mkdtemp()
+		self.cache_fname = access_stats.STATS_CACHE_FNAME
+		access_stats.STATS_CACHE_FNAME = os.path.join(self.cache_dir, 'stats_cache.json')
+		access_stats.STATS_CACHE.clear()
+
+	def tearDown(self):
+		os.remove(TEST_DB_NAME)
+		access_stats.STATS_CACHE_FNAME = self.cache_fname
+		access_stats.STATS_CACHE.clear()
+		shutil.rmtree(self.cache_dir)
+
+	def test_compare_access(self):
+		overall = compare_access(TEST_DB_NAME, n_resamples=200, workers=1)
+		by_subject = compare_access(TEST_DB_NAME, by='subject', n_resamples=200, workers=1)
+
+		self.assertEqual(len(overall), 1)
+		self.assertEqual(overall[0].group, 'All')
+		self.assertEqual(overall[0].difference, 1.0)
+		self.assertEqual((overall[0].ci_low, overall[0].ci_high), (1.0, 1.0))
+		self.assertEqual(overall[0].p_value, 1.0)
+		self.assertEqual([each.group for each in by_subject], ['Law'])
+
+	def test_subject_year_groups(self):
+		by_subject_year = compare_access(TEST_DB_NAME, by='subject_year', n_resamples=200, workers=1)
+
+		self.assertEqual([each.group for each in by_subject_year], [])
+		self.assertEqual(sorted(load_access_samples(TEST_DB_NAME, by='subject_year')), ['Law 2015', 'Law 2016'])
+
+	def test_resample_task(self):
+		support, open_counts, subscription_counts = value_histograms(np.array([5.0, 6.0, 7.0]), np.array([0.0, 1.0, 2.0]))
+		differences, extreme = resample_task(support, open_counts, subscription_counts, 500, 1)
+
+		self.assertEqual(len(differences), 500)
+		self.assertTrue(all(differences > 0))
+		self.assertLess(extreme, 500)
+		self.assertEqual(list(histogram_median(support, np.array([open_counts, subscription_counts]), 3)), [6.0, 1.0])
+
+	def test_cache_follows_data_version(self):
+		version = get_data_version(TEST_DB_NAME)
+		first = compare_access(TEST_DB_NAME, n_resamples=100, workers=1)
+		unique_ident = "{}_citations_None_100_0_0.95".format(version)
+		self.assertIn(unique_ident, access_stats.STATS_CACHE)
+
+		# a cached result must not resample again
+		with mock.patch('access_stats.resample_task', side_effect=AssertionError('resampled a cached result')):
+			second = compare_access(TEST_DB_NAME, n_resamples=100, workers=1)
+		build_test_db()
+
+		self.assertEqual(str(first[0]), str(second[0]))
+		self.assertNotEqual(get_data_version(TEST_DB_NAME), version)
+
+
 # Test to show that Plotly opens correctly
 class TestGraphs(unittest.TestCase):
 